@@ -6,9 +6,8 @@ import numpy as np
 import jax
 import jax.numpy as jnp
 import functools
-import diffrax
-from diffrax import diffeqsolve, Dopri5, ODETerm, SaveAt, PIDController, SteadyStateEvent
-import pandas as pd
+import diffrax  # diffrax 0.4.x (tested with 0.4.1 on jax 0.4.23) - NewtonNonlinearSolver and discrete_terminating_event are removed in later versions
+from diffrax import diffeqsolve, Kvaerno5, NewtonNonlinearSolver, ODETerm, SaveAt, PIDController, SteadyStateEvent
 from bokeh import plotting as bkplot, models as bkmodels, layouts as bklayouts
 
 import time
@@ -1258,6 +1257,52 @@ def ode_sim(par,  # dictionary with model parameters
     return sol
 
 
+# steady-state ODE simulator with DIFFRAX - implicit solver, terminates once the steady state is reached
+# (not jitted by itself: meant to be called within jitted kernels, where the circuit decoders remain python constants)
+def ode_steady_sim(par,  # dictionary with model parameters
+                   ode_with_circuit,  # ODE function for the cell with the synthetic gene circuit
+                   x0,  # initial condition VECTOR
+                   num_circuit_genes, num_circuit_miscs, circuit_name2pos, sgp4j,
+                   # dictionaries with circuit gene and miscellaneous specie names, species name to vector position decoder, relevant synthetic gene parameters in jax.array form
+                   tf, rtol, atol,
+                   # simulation parameters: maximum time frame, relative and absolute tolerances
+                   ss_rtol=None, ss_atol=None
+                   # relative and absolute tolerances for deciding that the steady state has been reached (default: same as the solver's)
+                   ):
+    # define the ODE term - the circuit decoders are closed over, so only the model parameters are traced as arguments
+    circuit_args = (
+        circuit_name2pos,  # gene name - position in circuit vector decoder
+        num_circuit_genes, num_circuit_miscs,  # number of genes and miscellaneous species in the circuit
+        sgp4j  # relevant synthetic gene parameters in jax.array form
+    )
+    vector_field = lambda t, y, args: ode_with_circuit(t, y, (args,) + circuit_args)
+    term = ODETerm(vector_field)
+
+    # define arguments of the ODE term
+    args = par  # model parameters
+
+    # define the solver - SDIRK method, as the host cell's timescales are disparate and make the system stiff
+    solver = Kvaerno5(nonlinear_solver=NewtonNonlinearSolver(rtol=rtol, atol=atol))
+
+    # define the step size controller, only save the final state
+    stepsize_controller = PIDController(rtol=rtol, atol=atol)
+    saveat = SaveAt(t1=True)
+
+    # stop the integration once the steady state is reached - the check is rms(dx/dt) < atol + rtol*rms(x), and rms(x) is dominated
+    # by metabolic proteins and tRNAs, so tolerances much looser than the solver's stop the integration before R and m_r have settled
+    steady_state_stop = SteadyStateEvent(rtol=ss_rtol, atol=ss_atol)
+
+    # solve the ODE
+    sol = diffeqsolve(term, solver,
+                      args=args,
+                      t0=tf[0], t1=tf[1], dt0=0.1, y0=x0, saveat=saveat,
+                      max_steps=None,
+                      discrete_terminating_event=steady_state_stop,
+                      stepsize_controller=stepsize_controller)
+
+    return sol
+
+
 # ode
 def ode(t, x, circuit_ode, args):
     # unpack the args
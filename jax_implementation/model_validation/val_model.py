@@ -10,9 +10,10 @@ os.environ["XLA_FLAGS"] = "--xla_force_host_platform_device_count={}".format(mul
 import numpy as np
 import jax
 import jax.numpy as jnp
+import functools
 
 import pandas as pd
-from bokeh import plotting as bkplot, models as bkmodels, layouts as bklayouts
+from bokeh import plotting as bkplot, layouts as bklayouts
 
 import time
 
@@ -22,11 +23,35 @@ jax.config.update("jax_enable_x64", True)
 print(jax.lib.xla_bridge.get_backend().platform)
 
 ## IMPORT CELL AND CIRCUIT SIMULATORS
-import sys, os
+import sys
 sys.path.append(os.path.abspath('..'))
 from jax_implementation.jax_cell_simulator import *
 from jax_implementation.het_modules.no_het import initialise as nohet_init, ode as nohet_ode, F_calc as nohet_F_calc, v as nohet_v
 
+## STEADY-STATE SIMULATION FOR A BATCH OF SETUPS
+# solving the ODEs for all setups at once, with vmapping over initial conditions and external chloramphenicol levels
+# (model and simulation parameters are keyword-only, so that they can be partialled into the jitted kernel as constants)
+def steady_states(x0s, h_exts,  # initial condition VECTORS and external chloramphenicol concentrations for all setups
+                  *,
+                  par,  # dictionary with model parameters
+                  ode_with_circuit,  # ODE function for the cell with synthetic circuit
+                  num_circuit_genes, num_circuit_miscs, circuit_name2pos, sgp4j,
+                  # numbers of circuit genes and miscellaneous species, species name to vector position decoder, relevant synthetic gene parameters in jax.array form
+                  tf, rtol, atol,  # simulation parameters: time frame, relative and absolute tolerances
+                  ss_rtol, ss_atol  # relative and absolute tolerances for deciding that the steady state has been reached
+                  ):
+    # find the steady state for a single setup
+    def steady_state_for_setup(x0, h_ext):
+        sim_par = par.copy()
+        sim_par['h_ext'] = h_ext
+        sol = ode_steady_sim(sim_par, ode_with_circuit, x0,
+                             num_circuit_genes, num_circuit_miscs, circuit_name2pos, sgp4j,
+                             tf, rtol, atol,
+                             ss_rtol, ss_atol)  # stops once the steady state is reached, only saving it
+        return sol.ys[-1, :]
+
+    return jax.vmap(steady_state_for_setup)(x0s, h_exts)
+
 ## MAIN FUNCTION
 def main():
     ## PREPARE: INITIALISE THE CELL MODEL
@@ -60,61 +85,53 @@ def main():
     # setups and measurements
     dataset = pd.read_csv('data/growth_rib_fit_notext.csv', header=None).values # read the experimental dataset (eq2 strain of Scott 2010)
     nutr_quals = np.logspace(np.log10(0.08), np.log10(0.5), 6) # nutrient qualities are equally log-spaced points
-    read_setups = []  # initialise setups array: (s,h_ext) pairs
-    read_measurements = []  # intialise measurements array: (l,phi_r) pairs
-    for i in range(0, dataset.shape[0]):
-        if (dataset[i, 0] > cutoff_growthrate):
-            # inputs
-            nutr_qual = nutr_quals[int(i / 5)]  # records start from worst nutrient quality
-            h = dataset[i, 3] * 1000  # all h values for same nutr quality same go one after another. Convert to nM from uM!
-            read_setups.append([nutr_qual, h])
-
-            # outputs
-            l = dataset[i, 0]  # growth rate (1/h)
-            phi_r = dataset[i, 2]  # ribosome mass fraction
-            read_measurements.append([l, phi_r])
-    setups=jnp.array(read_setups)
-    exp_measurements=jnp.array(read_measurements)
+    dataset_nutr_quals = np.repeat(nutr_quals, 5)[:dataset.shape[0]]  # records start from worst nutrient quality, 5 records per nutrient quality
+    above_cutoff = dataset[:, 0] > cutoff_growthrate  # mask of records with growth rates above the cutoff
+    # inputs: (s,h_ext) pairs
+    setups = jnp.array(np.column_stack((dataset_nutr_quals[above_cutoff],
+                                        dataset[above_cutoff, 3] * 1000)))  # all h values for same nutr quality same go one after another. Convert to nM from uM!
+    # outputs: (l,phi_r) pairs - growth rates (1/h) and ribosome mass fractions
+    exp_measurements = jnp.array(dataset[above_cutoff][:, [0, 2]])
 
     # measurement errors - average over all measurements
-    read_unscaled_errors = []  # measurement errors (stdevs of samples) for (l, phi_r)
-    read_replicates = []  # replicate numbers for (l, phi_r)
     error_dataset = pd.read_csv('data/growth_rib_fit_errors_notext.csv', header=None).values # read the experimental dataset (eq2 strain of Scott 2010)
-    exp_errors = jnp.ones(exp_measurements.shape) * jnp.array([[error_dataset[:, 0].mean(), error_dataset[:, 2].mean()]])
+    exp_errors = jnp.broadcast_to(jnp.array([error_dataset[:, 0].mean(), error_dataset[:, 2].mean()]), exp_measurements.shape)
 
     ## SPECIFY SIMULATION PARAMETERS
     tf = (0, 480)  # simulation time frame - assume that the cell is close to steady state after 1000h
-    rtol = 1e-6; atol = 1e-6  # relative and absolute tolerances for the ODE solver
+    rtol = 1e-5; atol = 1e-5  # relative and absolute tolerances for the ODE solver - only the steady state matters
+    ss_rtol = 1e-5; ss_atol = 1e-5  # relative and absolute tolerances for deciding that the steady state has been reached
 
     ## SIMULATE
-    model_predictions = []
-    for i in range(0,len(setups)):
-        # set the medium nutrient quality
-        sim_init_conds = cellmodel_auxil.default_init_conds(par)  # get default initial conditions
-        sim_init_conds['s'] = setups[i, 0]
-
-        # set the external chloramphenicol conc.
-        sim_par = par.copy()
-        sim_par['h_ext'] = setups[i, 1]
-
-        sol = ode_sim(sim_par,  # dictionary with model parameters
-                      ode_with_circuit,  # ODE function for the cell with synthetic circuit
-                      cellmodel_auxil.x0_from_init_conds(sim_init_conds, circuit_genes, circuit_miscs),
-                      # initial condition VECTOR
-                      len(circuit_genes), len(circuit_miscs), circuit_name2pos,
-                      # dictionaries with circuit gene and miscellaneous specie names, species name to vector position decoder
-                      cellmodel_auxil.synth_gene_params_for_jax(par, circuit_genes),
-                      # synthetic gene parameters for calculating k values
-                      tf, jnp.array([tf[1]]),  # just saving the final (steady) state of the system
-                      rtol,
-                      atol)  # simulation parameters: time frame, save time step, relative and absolute tolerances
-        # get growth rate
-        _, ls, _, _,_,_,_ = cellmodel_auxil.get_e_l_Fr_nu_psi_T_D_Dnohet(sol.ts, sol.ys, par, circuit_genes, circuit_miscs, circuit_name2pos)
-        l=ls[-1]
-        # get ribosomal mass fraction
-        phi_r = float((sol.ys[-1,3]+sol.ys[-1,7])*par['n_r']/par['M'])
-        # record
-        model_predictions.append([l, phi_r])
+    # initial conditions for each setup: default, but with the setup's nutrient quality
+    x0_default = cellmodel_auxil.x0_from_init_conds(init_conds, circuit_genes, circuit_miscs)
+    x0s = jnp.broadcast_to(x0_default, (setups.shape[0], x0_default.shape[0])).at[:, 6].set(setups[:, 0])
+
+    # jitted steady-state simulator, with the model and simulation parameters baked in as constants
+    sim_steady_states = jax.jit(functools.partial(steady_states,
+                                                  par=par, ode_with_circuit=ode_with_circuit,
+                                                  num_circuit_genes=len(circuit_genes), num_circuit_miscs=len(circuit_miscs),
+                                                  circuit_name2pos=circuit_name2pos,
+                                                  sgp4j=cellmodel_auxil.synth_gene_params_for_jax(par, circuit_genes),
+                                                  tf=tf, rtol=rtol, atol=atol,
+                                                  ss_rtol=ss_rtol, ss_atol=ss_atol))
+
+    # compile ahead of time, so that compilation and simulation times are reported separately
+    timer = time.time()
+    sim_steady_states_compiled = sim_steady_states.lower(x0s, setups[:, 1]).compile()
+    print('Setups simulator compiled in: ', time.time() - timer, ' seconds')
+
+    # simulate all setups at once
+    timer = time.time()
+    xs_ss = sim_steady_states_compiled(x0s, setups[:, 1]).block_until_ready()
+    print('Setups simulated in: ', time.time() - timer, ' seconds')
+
+    # get growth rates
+    _, ls, _, _, _, _, _ = cellmodel_auxil.get_e_l_Fr_nu_psi_T_D_Dnohet(jnp.zeros(xs_ss.shape[0]), xs_ss, par, circuit_genes, circuit_miscs, circuit_name2pos)
+    # get ribosomal mass fractions
+    phi_rs = (xs_ss[:, 3] + xs_ss[:, 7]) * par['n_r'] / par['M']
+    # record
+    model_predictions = np.stack((np.array(ls), np.array(phi_rs)), axis=1)
 
     ## PLOT: COMPARISON OF FITTED MODEL PREDICTIONS WITH EXPERIMENTAL DATA (BEING FITTED)
     bkplot.output_file('model_vs_scott2010.html')
@@ -158,12 +175,10 @@ def main():
     # first law
     xs_1 = [[], [], [], []]
     ys_1 = [[], [], [], []]
-    nutrind = 0
     chlorind = 0
     last_nutr_qual = setups[0, 0]
     for i in range(0, len(setups)):
         if (setups[i][0] != last_nutr_qual):
-            nutrind += 1
             chlorind = 0
             last_nutr_qual = setups[i][0]
         xs_1[chlorind].append(fitted_predictions_forplot[i][0])
@@ -187,7 +202,6 @@ def main():
     xs_2 = [[]]
     ys_2 = [[]]
     nutrind = 0
-    chlorind = 0
     last_nutr_qual = setups[0, 0]
     for i in range(0, len(setups)):
         if (setups[i, 0] != last_nutr_qual):
@@ -215,40 +229,26 @@ def main():
     # define nutrient qualities
     vl_nutr_quals=np.logspace(-2,0,32)
 
-    # initialsie output arrays
-    vl_ls=np.zeros(len(vl_nutr_quals))
-    vl_phirs=np.zeros(len(vl_nutr_quals))
-    vl_es=np.zeros(len(vl_nutr_quals))
-    vl_ppgpps=np.zeros(len(vl_nutr_quals))
-
-    # time frame for comparison simulations - longer than the one used for fitting to avoid showing non-steady state values
-    vl_tf=[0,48]
-
-    for i in range(0, len(vl_nutr_quals)):
-        print(vl_nutr_quals[i])
-        # set the medium nutrient quality
-        vl_init_conds = cellmodel_auxil.default_init_conds(par)  # get default initial conditions
-        vl_init_conds['s'] = vl_nutr_quals[i]  # set nutrient quality
-
-        sol = ode_sim(par,  # dictionary with model parameters
-                      ode_with_circuit,  # ODE function for the cell with synthetic circuit
-                      cellmodel_auxil.x0_from_init_conds(vl_init_conds, circuit_genes, circuit_miscs),
-                      # initial condition VECTOR
-                      len(circuit_genes), len(circuit_miscs), circuit_name2pos,
-                      # dictionaries with circuit gene and miscellaneous specie names, species name to vector position decoder
-                      cellmodel_auxil.synth_gene_params_for_jax(par, circuit_genes),
-                      # synthetic gene parameters for calculating k values
-                      tf, jnp.array([tf[1]]),  # just saving the final (steady) state of the system
-                      rtol,
-                      atol)  # simulation parameters: time frame, save time step, relative and absolute tolerances
-        # translation elongation rate, growth rate and inverse of ppGpp level
-        es, ls, _, _, _, Ts, _ = cellmodel_auxil.get_e_l_Fr_nu_psi_T_D_Dnohet(sol.ts, sol.ys, par, circuit_genes,
-                                                                               circuit_miscs, circuit_name2pos)
-        vl_es[i] = es[-1]
-        vl_ls[i] = ls[-1]
-        vl_ppgpps[i] = 1 / Ts[-1]
-        # get ribosomal mass fraction
-        vl_phirs[i]=float(sol.ys[-1, 3] * par['n_r'] / par['M'])
+    # initial conditions: default, but with the respective nutrient quality
+    vl_x0s = jnp.broadcast_to(x0_default, (len(vl_nutr_quals), x0_default.shape[0])).at[:, 6].set(vl_nutr_quals)
+    vl_h_exts = jnp.full(len(vl_nutr_quals), par['h_ext'])  # no chloramphenicol added beyond the default
+
+    # simulate all nutrient qualities at once (compiled separately, as the batch size differs from that of the setups)
+    timer = time.time()
+    sim_steady_states_vl_compiled = sim_steady_states.lower(vl_x0s, vl_h_exts).compile()
+    print('Nutrient qualities simulator compiled in: ', time.time() - timer, ' seconds')
+    timer = time.time()
+    vl_xs_ss = sim_steady_states_vl_compiled(vl_x0s, vl_h_exts).block_until_ready()
+    print('Nutrient qualities simulated in: ', time.time() - timer, ' seconds')
+
+    # translation elongation rate, growth rate and inverse of ppGpp level
+    es, ls, _, _, _, Ts, _ = cellmodel_auxil.get_e_l_Fr_nu_psi_T_D_Dnohet(jnp.zeros(vl_xs_ss.shape[0]), vl_xs_ss, par, circuit_genes,
+                                                                           circuit_miscs, circuit_name2pos)
+    vl_es = np.array(es)
+    vl_ls = np.array(ls)
+    vl_ppgpps = np.array(1 / Ts)
+    # get ribosomal mass fractions
+    vl_phirs = np.array(vl_xs_ss[:, 3] * par['n_r'] / par['M'])
 
     ## MORE REALITY VS MODEL PREDICTION COMPARISONS: MAKE PLOTS
     bkplot.output_file('model_vs_chure2023.html')
@@ -5,13 +5,10 @@
 import numpy as np
 import jax
 import jax.numpy as jnp
-from bokeh import plotting as bkplot, models as bkmodels, layouts as bklayouts
+from bokeh import plotting as bkplot
 
 import time
 
-## SYNTHETIC GENE CIRCUIT IMPORTS
-from het_modules.aif_controller import initialise as aif_init, ode as aif_ode, F_calc as aif_F_calc, v as aif_v
-
 ## IMPORT CELL AND CIRCUIT SIMULATORS
 from jax_cell_simulator import *
 from het_modules.aif_controller import initialise as aif_init, ode as aif_ode, F_calc as aif_F_calc, v as aif_v